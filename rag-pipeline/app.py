@@ -1,23 +1,26 @@
+import logging
 import streamlit as st
-import os
 from pathlib import Path
 from dotenv import load_dotenv
 from fetch_restaurant import load_restaurants
 from chunking import build_dish_chunks
-from index_faiss import create_faiss_index
-from chatbot import answer
+from index_faiss import create_faiss_index, INDEX_CACHE_DIR
+from chatbot import answer_stream
 
 load_dotenv()
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # --- Configuration ---
-DATA_PATH = Path('D:/rag-restaurant-assistant/data/processed/knowledgebase.json')
+DATA_PATH = Path(__file__).resolve().parents[1] / 'data' / 'processed' / 'knowledgebase.json'
 EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
 
 # --- Data and Model Loading Functions ---
 
-# Cache data loading and chunking to avoid reloading on every interaction
-@st.cache_data(show_spinner="Loading restaurant data...")
-def load_restaurants_and_chunk_data(json_path):
+# Cache data loading and chunking to avoid reloading on every interaction.
+# cache_resource shares one parsed copy across sessions and reruns (cache_data would
+# hand out a fresh copy each time); the file's mtime is part of the key so edits reload.
+@st.cache_resource(show_spinner="Loading restaurant data...")
+def load_restaurants_and_chunk_data(json_path, data_mtime=None):
     """Loads restaurant data from JSON and creates structured chunks."""
     try:
         restaurants_data = load_restaurants(json_path=json_path)
@@ -36,16 +39,18 @@ def load_restaurants_and_chunk_data(json_path):
         st.error(f"Error loading or chunking data: {e}")
         return None, None
 
-# Cache resource loading (models, index) for efficiency
-@st.cache_resource(show_spinner="Setting up embedding model and index...")
-def load_models_and_index(_chunks):
+# Cache resource loading (models, index) for efficiency. _chunks is not hashed by
+# Streamlit, so data_mtime keys the cache: edited data must not reuse an index
+# built from the old chunks. Only the current index is kept.
+@st.cache_resource(show_spinner="Setting up embedding model and index...", max_entries=1)
+def load_models_and_index(_chunks, data_mtime=None):
     """Loads the embedding model and creates the FAISS index."""
     if _chunks is None:
         st.error("Cannot initialize models without data chunks.")
         return None, None
 
     try:
-        embed_model, index = create_faiss_index(_chunks, model_name=EMBEDDING_MODEL)
+        embed_model, index = create_faiss_index(_chunks, model_name=EMBEDDING_MODEL, cache_dir=INDEX_CACHE_DIR)
         if embed_model is None or index is None:
              st.error("Failed to initialize embedding model or FAISS index.")
              return None, None
@@ -60,10 +65,11 @@ st.set_page_config(page_title="Restaurant Chatbot", layout="centered")
 st.title("Restaurant Chatbot")
 st.caption("Ask me about dishes, prices, comparisons, and more!")
 
-restaurants_data, chunks = load_restaurants_and_chunk_data(DATA_PATH)
+data_mtime = DATA_PATH.stat().st_mtime if DATA_PATH.exists() else None
+restaurants_data, chunks = load_restaurants_and_chunk_data(DATA_PATH, data_mtime)
 
 if restaurants_data and chunks:
-    embed_model, index = load_models_and_index(chunks)
+    embed_model, index = load_models_and_index(chunks, data_mtime)
 
     if embed_model and index:
         # Initialize Streamlit chat history if it doesn't exist
@@ -81,16 +87,18 @@ if restaurants_data and chunks:
             with st.chat_message("user"):
                 st.markdown(prompt)
 
-            # Generate and display the assistant's response
+            # Generate and display the assistant's response, rendering Gemini output as it streams in
             with st.chat_message("assistant"):
-                message_placeholder = st.empty() # For streaming-like effect
-                full_response = ""
                 with st.spinner("Thinking..."):
                     # Pass restaurants_data for direct lookups (e.g., ratings)
-                    response = answer(prompt, embed_model, index, chunks, restaurants_data)
-                    full_response = response
+                    response_stream = answer_stream(prompt, embed_model, index, chunks, restaurants_data)
+                    first_piece = next(response_stream, "")
 
-                message_placeholder.markdown(full_response)
+                def render_pieces():
+                    yield first_piece
+                    yield from response_stream
+
+                full_response = st.write_stream(render_pieces())
 
             # Add assistant response to chat history
             st.session_state.messages.append({"role": "assistant", "content": full_response})
@@ -1,21 +1,40 @@
-import google.generativeai as genai
+import functools
+import math
 import os
 import re
+import sys
+import threading
+import time
+from collections import OrderedDict
 import numpy as np
 from dotenv import load_dotenv
-from index_faiss import retrieve_chunks
+from index_faiss import embed_query, retrieve_chunks, retrieve_chunks_coalesced
 from query_planner import parse_query
 
 load_dotenv()
 
 # --- Configure Gemini API ---
-gemini_model = None
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    print("Warning: GEMINI_API_KEY environment variable not set. RAG fallback will be disabled.")
-else:
+# Greedy decoding with a cap on answer length bounds the fallback's generation time;
+# the structured intents (comparisons, prices, menus) are templated and never reach Gemini.
+GENERATION_CONFIG = {
+    "temperature": 0.0,
+    "candidate_count": 1,
+    "max_output_tokens": int(os.getenv("GEMINI_MAX_OUTPUT_TOKENS", "1024")),
+}
+
+@functools.lru_cache(maxsize=1)
+def get_gemini_model():
+    """
+    Configures the Gemini client on first use and returns the shared model, or None
+    when no API key is set. Questions answered without the fallback never pay for it.
+    """
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        print("Warning: GEMINI_API_KEY environment variable not set. RAG fallback will be disabled.")
+        return None
+    import google.generativeai as genai # Deferred: the SDK is slow to import and only the fallback needs it
     genai.configure(api_key=api_key)
-    gemini_model = genai.GenerativeModel('gemini-2.0-flash')
+    return genai.GenerativeModel('gemini-2.0-flash', generation_config=GENERATION_CONFIG)
 
 # --- Prompt Template for Gemini RAG Fallback ---
 PROMPT_TEMPLATE = """
@@ -34,32 +53,277 @@ User Question: {question}
 Answer:
 """
 
+# The template is constant, so split it around its two fields once at import time
+_PROMPT_PREFIX, _PROMPT_REST = PROMPT_TEMPLATE.split("{context}")
+_PROMPT_MIDDLE, _PROMPT_SUFFIX = _PROMPT_REST.split("{question}")
+
+def render_prompt(context, question):
+    """Equivalent to PROMPT_TEMPLATE.format(context=..., question=...) without re-parsing the template."""
+    return f"{_PROMPT_PREFIX}{context}{_PROMPT_MIDDLE}{question}{_PROMPT_SUFFIX}"
+
+# Maps query_planner dietary tags to the normalized labels found on chunks
+DIETARY_LABELS = {'vegetarian': 'veg', 'vegan': 'vegan', 'gluten_free': 'gluten_free'}
+
+# --- Precomputed Lookups ---
+_lookup_cache = {'chunks': None, 'tables': None}
+_restaurant_lookup_cache = {'restaurants': None, 'by_name': None}
+
+def build_chunk_indexes(chunks):
+    """
+    Indexes chunk positions by lowercased dish name and restaurant id, plus the chunk
+    for each (dish, restaurant) pair, so intent branches do dict lookups instead of
+    lowercasing and scanning every chunk.
+    """
+    dish_idx = {}
+    resto_idx = {}
+    dish_resto = {}
+    for i, c in enumerate(chunks):
+        dish_lc = c.get('dish_name_lc') or sys.intern(c.get('dish_name', '').lower())
+        resto_lc = c.get('resto_id_lc') or sys.intern(c.get('resto_id', '').lower())
+        dish_idx.setdefault(dish_lc, []).append(i)
+        resto_idx.setdefault(resto_lc, []).append(i)
+        dish_resto.setdefault((dish_lc, resto_lc), c) # First match, as the old linear scan returned
+    return dish_idx, resto_idx, dish_resto
+
+def build_price_array(chunks):
+    """Chunk prices as a float array (NaN where missing), so price filters run as one vectorized comparison."""
+    return np.array([c['price'] if isinstance(c.get('price'), (int, float)) else np.nan for c in chunks], dtype=np.float64)
+
+def build_dietary_matrix(chunks):
+    """
+    Builds a boolean chunk x dietary-label incidence matrix (struct-of-arrays form)
+    and the label -> column mapping, so dietary filters become column slices.
+    """
+    chunk_labels = []
+    label_cols = {}
+    for c in chunks:
+        attrs = c.get('attributes') or {}
+        labels = [key.lower() for key, value in attrs.items() if value is True] # Boolean flags such as 'vegan'
+        veg_nonveg = attrs.get('veg_nonveg')
+        if isinstance(veg_nonveg, str) and veg_nonveg.strip():
+            labels.append(veg_nonveg.strip().lower())
+        for label in labels:
+            label_cols.setdefault(label, len(label_cols))
+        chunk_labels.append(labels)
+
+    matrix = np.zeros((len(chunks), len(label_cols)), dtype=bool)
+    for i, labels in enumerate(chunk_labels):
+        matrix[i, [label_cols[label] for label in labels]] = True
+    return matrix, label_cols
+
+def dietary_mask(tables, diets):
+    """Boolean mask over chunks that carry every requested dietary tag."""
+    matrix, label_cols = tables['dietary_matrix'], tables['dietary_cols']
+    cols = [label_cols.get(DIETARY_LABELS.get(d, d)) for d in diets]
+    if any(col is None for col in cols):
+        return np.zeros(matrix.shape[0], dtype=bool) # A tag no chunk carries matches nothing
+    return matrix[:, cols].all(axis=1)
+
+def get_lookup_tables(chunks):
+    """Returns the lookup tables for `chunks`, rebuilding them only when a different list is passed."""
+    if _lookup_cache['chunks'] is not chunks:
+        dish_idx, resto_idx, dish_resto = build_chunk_indexes(chunks)
+        dietary_matrix, dietary_cols = build_dietary_matrix(chunks)
+        dish_map = {
+            resto_lc: tuple(sorted({chunks[i].get('dish_name', 'Unknown Dish') for i in positions}))
+            for resto_lc, positions in resto_idx.items()
+        }
+        _lookup_cache['tables'] = {
+            'dish_idx': dish_idx,
+            'resto_idx': resto_idx,
+            'dish_resto': dish_resto,
+            'dish_map': dish_map, # resto_id.lower() -> sorted unique dish names
+            'prices': build_price_array(chunks),
+            'dietary_matrix': dietary_matrix,
+            'dietary_cols': dietary_cols,
+            # Known names (lowercased) for matching entities in free-form questions
+            'entity_names': tuple(name for name in dict.fromkeys((*resto_idx, *dish_idx)) if len(name) > 2),
+        }
+        _lookup_cache['chunks'] = chunks
+    return _lookup_cache['tables']
+
+def get_restaurants_by_name(restaurants):
+    """Returns a lowercased name -> restaurant dict (first occurrence wins), rebuilt only for a new list."""
+    if _restaurant_lookup_cache['restaurants'] is not restaurants:
+        by_name = {}
+        for resto in restaurants:
+            by_name.setdefault(resto.get('name', '').strip().lower(), resto)
+        _restaurant_lookup_cache['by_name'] = by_name
+        _restaurant_lookup_cache['restaurants'] = restaurants
+    return _restaurant_lookup_cache['by_name']
+
+# --- Answer Cache ---
+# Answers for repeated questions, keyed by the normalized question. Entries are
+# dropped whenever a different chunks list is passed in (i.e. the data was reloaded)
+# and expire after ANSWER_CACHE_TTL seconds, so Gemini answers are regenerated now and then.
+ANSWER_CACHE_SIZE = 1024
+ANSWER_CACHE_TTL = float(os.getenv('ANSWER_CACHE_TTL', '3600'))
+_answer_cache = {'chunks': None, 'entries': OrderedDict()}
+_answer_cache_lock = threading.Lock()
+
+# Gemini fallback answers for recent questions, reused for paraphrases whose query
+# embeddings are close enough (cosine similarity; embeddings are normalized) and that
+# mention the same known restaurants and dishes. MiniLM scores questions differing
+# only in the entity ("what's good at X" / "... at Y") well above 0.9.
+SIMILAR_ANSWER_CACHE_SIZE = 40
+SIMILAR_ANSWER_THRESHOLD = 0.95
+_similar_answer_cache = {'chunks': None, 'entries': OrderedDict()}
+
 # --- Helper Functions ---
+_RATING_RE = re.compile(r"(\d+(?:\.\d+)?)") # Extracts number like 4.5 or 4
+
 def find_restaurant(name, restaurants):
     """Finds the first matching restaurant dict by name (case-insensitive)."""
-    for resto in restaurants:
-        if resto.get('name', '').strip().lower() == name.strip().lower():
-            return resto
-    return None
+    return get_restaurants_by_name(restaurants).get(name.strip().lower())
 
 def list_dishes(resto_id, chunks):
     """Retrieves unique dish names for a specific restaurant ID (case-insensitive)."""
-    names = {c.get('dish_name', 'Unknown Dish') for c in chunks if c.get('resto_id', '').lower() == resto_id.lower()}
-    return sorted(list(names))
+    return list(get_lookup_tables(chunks)['dish_map'].get(resto_id.lower(), ())) # Copy so callers can't alter the table
 
 def parse_rating(rating_str):
     """Attempts to extract the first numerical rating found in a string."""
+    if isinstance(rating_str, (int, float)) and not isinstance(rating_str, bool): return float(rating_str)
     if not isinstance(rating_str, str): return None
-    match = re.search(r"(\d+(?:\.\d+)?)", rating_str) # Extracts number like 4.5 or 4
+    try:
+        rating = float(rating_str) # Fast path for plain values like '3.7'
+        if math.isfinite(rating): return rating
+    except ValueError:
+        pass
+    match = _RATING_RE.search(rating_str)
     if match:
         try: return float(match.group(1))
         except ValueError: return None
     return None
 
+def normalize_question(question):
+    """Case- and whitespace-insensitive form of a question, used as the answer cache key."""
+    return " ".join(question.lower().split())
+
+def question_entities(question, chunks):
+    """Known restaurant and dish names (lowercased) mentioned in a question."""
+    question_lc = normalize_question(question)
+    return frozenset(name for name in get_lookup_tables(chunks)['entity_names'] if name in question_lc)
+
 # --- Main Answering Function (Hybrid Approach) ---
+def _cached_answer(key, chunks):
+    """Returns the cached answer for `key`, or None. Clears the cache if `chunks` changed."""
+    with _answer_cache_lock:
+        entries = _answer_cache['entries']
+        if _answer_cache['chunks'] is not chunks:
+            entries.clear()
+            _answer_cache['chunks'] = chunks
+            return None
+        if key in entries:
+            expires_at, response = entries[key]
+            if expires_at <= time.monotonic():
+                del entries[key]
+                return None
+            entries.move_to_end(key)
+            return response
+    return None
+
+def _store_answer(key, chunks, response):
+    """Caches a successful answer for `key`."""
+    # "Sorry..." responses include transient failures (e.g. Gemini errors), so only real answers are kept
+    if not response or response.startswith("Sorry"):
+        return
+    with _answer_cache_lock:
+        if _answer_cache['chunks'] is chunks:
+            entries = _answer_cache['entries']
+            entries[key] = (time.monotonic() + ANSWER_CACHE_TTL, response)
+            entries.move_to_end(key)
+            if len(entries) > ANSWER_CACHE_SIZE:
+                entries.popitem(last=False)
+
 def answer(question, embed_model, index, chunks, restaurants, k=500):
+    """
+    Answers questions, returning the cached answer when the same question was already answered.
+    """
+    key = (normalize_question(question), k)
+    cached = _cached_answer(key, chunks)
+    if cached is not None:
+        return cached
+
+    response = _answer_uncached(question, embed_model, index, chunks, restaurants, k)
+    _store_answer(key, chunks, response)
+    return response
+
+def answer_stream(question, embed_model, index, chunks, restaurants, k=500):
+    """
+    Streaming variant of answer(): yields the response in pieces. Only the Gemini
+    fallback actually streams; cached and direct answers arrive as a single piece.
+    """
+    key = (normalize_question(question), k)
+    cached = _cached_answer(key, chunks)
+    if cached is not None:
+        yield cached
+        return
+
+    response = _answer_uncached(question, embed_model, index, chunks, restaurants, k, stream=True)
+    if isinstance(response, str):
+        _store_answer(key, chunks, response)
+        yield response
+        return
+
+    pieces = []
+    try:
+        for piece in response:
+            pieces.append(piece)
+            yield piece
+    except Exception as e:
+        yield gemini_error_message(e) # Partial answers are not cached
+        return
+    _store_answer(key, chunks, "".join(pieces))
+
+def _similar_cached_answer(q_vec, entities, chunks):
+    """
+    Returns the cached fallback answer for the most similar recent question that
+    mentions the same entities, or None.
+    """
+    with _answer_cache_lock:
+        entries = _similar_answer_cache['entries']
+        if _similar_answer_cache['chunks'] is not chunks:
+            entries.clear()
+            _similar_answer_cache['chunks'] = chunks
+            return None
+        now = time.monotonic()
+        for key in [key for key, entry in entries.items() if entry[0] <= now]:
+            del entries[key]
+        keys = [key for key, entry in entries.items() if entry[2] == entities]
+        if not keys:
+            return None
+        scores = np.stack([entries[key][1] for key in keys]) @ q_vec
+        best = int(np.argmax(scores))
+        if scores[best] < SIMILAR_ANSWER_THRESHOLD:
+            return None
+        entries.move_to_end(keys[best])
+        return entries[keys[best]][3]
+
+def _store_similar_answer(question, q_vec, entities, chunks, response):
+    """Caches a successful fallback answer together with its question embedding."""
+    if not response or response.startswith("Sorry"):
+        return
+    with _answer_cache_lock:
+        if _similar_answer_cache['chunks'] is chunks:
+            entries = _similar_answer_cache['entries']
+            key = normalize_question(question)
+            entries[key] = (time.monotonic() + ANSWER_CACHE_TTL, q_vec, entities, response)
+            entries.move_to_end(key)
+            if len(entries) > SIMILAR_ANSWER_CACHE_SIZE:
+                entries.popitem(last=False)
+
+def _store_similar_answer_stream(pieces_stream, question, q_vec, entities, chunks):
+    """Passes a streamed answer through, caching it once it completes."""
+    pieces = []
+    for piece in pieces_stream:
+        pieces.append(piece)
+        yield piece
+    _store_similar_answer(question, q_vec, entities, chunks, "".join(pieces))
+
+def _answer_uncached(question, embed_model, index, chunks, restaurants, k=500, stream=False):
     """
     Answers questions by checking specific intents first, then uses RAG+Gemini as fallback.
+    With stream=True the Gemini fallback returns a generator of text pieces instead of a string.
     """
     if not restaurants:
          return "Sorry, the restaurant data could not be loaded for specific queries."
@@ -75,9 +339,9 @@ def answer(question, embed_model, index, chunks, restaurants, k=500):
     # --- Handling Specific Intents Directly ---
 
     # 1) Dish Price Query
-    if spec.get('dish_price_query'):
-        dish_name = spec['dish_price_query']
-        matching_chunks = [c for c in chunks if c.get('dish_name', '').lower() == dish_name.lower()]
+    if spec.dish_price_query:
+        dish_name = spec.dish_price_query
+        matching_chunks = [chunks[i] for i in get_lookup_tables(chunks)['dish_idx'].get(dish_name.lower(), ())]
         if not matching_chunks:
             return f"Sorry, I couldn't find the dish '{dish_name}' in any restaurant."
 
@@ -91,20 +355,21 @@ def answer(question, embed_model, index, chunks, restaurants, k=500):
         if not results:
              return f"Sorry, I found the dish '{dish_name}' but couldn't retrieve price information."
 
-        unique_results = sorted(list(set(results)))
+        unique_results = sorted(dict.fromkeys(results))
         return f"Prices for '{dish_name}':{md_newline}" + md_newline.join(unique_results)
 
     # 2) Spice Comparison
-    elif spec.get('spice_cmp'):
-        spice_info = spec['spice_cmp']
-        dish = spice_info.get('dish')
-        resto_names = spice_info.get('restaurants')
+    elif spec.spice_cmp:
+        dish = spec.spice_cmp.dish
+        resto_names = spec.spice_cmp.restaurants
         if not dish or not resto_names or len(resto_names) != 2:
              return "Sorry, I need a dish name and exactly two restaurant names to compare spice levels."
         r1_name, r2_name = resto_names
 
-        d1 = next((c for c in chunks if c.get('dish_name', '').lower() == dish.lower() and c.get('resto_id', '').lower() == r1_name.lower()), None)
-        d2 = next((c for c in chunks if c.get('dish_name', '').lower() == dish.lower() and c.get('resto_id', '').lower() == r2_name.lower()), None)
+        dish_resto = get_lookup_tables(chunks)['dish_resto']
+        dish_lc = dish.lower()
+        d1 = dish_resto.get((dish_lc, r1_name.lower()))
+        d2 = dish_resto.get((dish_lc, r2_name.lower()))
 
         if not d1 or not d2:
             missing_restos = [name for name, data in [(r1_name, d1), (r2_name, d2)] if data is None]
@@ -119,10 +384,9 @@ def answer(question, embed_model, index, chunks, restaurants, k=500):
                 f"- Spice level at {r2_name}: {spice2}")
 
     # 3) Feature Comparison (Rating & Price Range)
-    elif spec.get('feature_compare'):
-        compare_info = spec['feature_compare']
-        resto_names = compare_info.get('restaurants')
-        feature = compare_info.get('feature')
+    elif spec.feature_compare:
+        resto_names = spec.feature_compare.restaurants
+        feature = spec.feature_compare.feature
 
         if not resto_names or len(resto_names) != 2:
             return "Sorry, I need exactly two restaurant names to compare features."
@@ -167,8 +431,8 @@ def answer(question, embed_model, index, chunks, restaurants, k=500):
         return md_newline.join(response_parts)
 
     # 4) Price Range Query
-    elif spec.get('price_range_query'):
-        resto_name = spec['price_range_query']
+    elif spec.price_range_query:
+        resto_name = spec.price_range_query
         resto_data = find_restaurant(resto_name, restaurants)
         if not resto_data:
             return f"Sorry, I couldn't find information for restaurant '{resto_name}'."
@@ -179,8 +443,8 @@ def answer(question, embed_model, index, chunks, restaurants, k=500):
             return f"The approximate price range for '{resto_name}' is: {price_range}."
 
     # 5) List Dishes at Restaurant
-    elif spec.get('restaurant'):
-        resto_id = spec['restaurant']
+    elif spec.restaurant:
+        resto_id = spec.restaurant
         names = list_dishes(resto_id, chunks)
         if not names:
             resto_data = find_restaurant(resto_id, restaurants)
@@ -191,15 +455,20 @@ def answer(question, embed_model, index, chunks, restaurants, k=500):
         return f"Dishes available at {resto_id}:{md_newline}" + md_newline.join(names)
 
     # 6) Price Filter (Standalone)
-    elif spec.get('price_lt') is not None:
-        thr = spec['price_lt']
-        idxs = [i for i, c in enumerate(chunks)
-                if c.get('price') is not None and isinstance(c.get('price'), (int, float)) and c['price'] < thr]
+    elif spec.price_lt is not None:
+        thr = spec.price_lt
+        tables = get_lookup_tables(chunks)
+        mask = tables['prices'] < thr # NaN (no price) compares False
+        diets = spec.dietary
+        diet_filter = ", ".join(diets) or None
+        if diets:
+            mask &= dietary_mask(tables, diets)
+        idxs = np.flatnonzero(mask).tolist()
         if not idxs:
+            if diet_filter:
+                return f"Sorry, I couldn't find any {diet_filter} dishes under ₹{thr}."
             return f"Sorry, I couldn't find any dishes under ₹{thr}."
 
-        diet_filter = None
-
         # Retrieve/select chunks
         if len(idxs) > k:
              # Use semantic search on the filtered subset if it's large
@@ -215,66 +484,121 @@ def answer(question, embed_model, index, chunks, restaurants, k=500):
              return f"Sorry, no matching dishes found for your criteria."
 
         dish_details = [f"{c.get('dish_name', '?')} (at {c.get('resto_id', '?')}) - ₹{c.get('price', 'N/A'):.2f}" for c in selected]
-        unique_details = sorted(list(set(dish_details)))
+        unique_details = list(dict.fromkeys(dish_details)) # Keeps relevance order when the subset was ranked semantically
         filter_desc = f"under ₹{thr}"
         if diet_filter: filter_desc += f" ({diet_filter})"
         return f"Here are some dishes {filter_desc}:{md_newline}" + md_newline.join(unique_details)
 
     # --- Fallback: RAG with Gemini API ---
     else:
-        if gemini_model is None:
+        if get_gemini_model() is None:
             return "Sorry, I cannot answer this general question as the advanced AI service is unavailable."
 
+        try:
+            q_vec = embed_query(question, embed_model)[0]
+        except Exception as e:
+            print(f"Could not embed question for the similar-answer cache: {e}")
+            q_vec = None
+        if q_vec is not None:
+            entities = question_entities(question, chunks)
+            cached = _similar_cached_answer(q_vec, entities, chunks)
+            if cached is not None:
+                print(f"Reusing the answer to a similar question for: {question}")
+                return cached
+
         print(f"No specific intent matched. Performing RAG + Gemini fallback for: {question}")
-        top_chunks = retrieve_chunks(question, embed_model, index, chunks, k=k)
+        top_chunks = retrieve_chunks_coalesced(question, embed_model, index, chunks, k=k)
         if not top_chunks:
             print("No relevant chunks found by semantic search for Gemini.")
             context_str = "No specific information found in the knowledge base for this question."
         else:
             # Prepare context from retrieved chunk text
-            context_str = "\n---\n".join(chunk.get('text', '') for chunk in top_chunks)
-
-        prompt = PROMPT_TEMPLATE.format(context=context_str, question=question)
-
-        print("Sending request to Gemini API...")
-        try:
-            # Example safety settings (adjust thresholds as needed)
-            safety_settings = [
-                {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-                {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-                {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-                {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-            ]
-            response = gemini_model.generate_content(prompt, safety_settings=safety_settings)
-
-            # Handle potential blocks or empty responses
-            if not response.candidates:
-                 print("Gemini API response blocked or empty.")
-                 try:
-                     feedback = response.prompt_feedback
-                     print(f"Prompt Feedback: {feedback}")
-                     block_reason = getattr(feedback, 'block_reason', 'Unknown')
-                     return f"Sorry, the request could not be completed due to safety filters (Reason: {block_reason}). Please rephrase your question."
-                 except Exception:
-                     return "Sorry, the request could not be completed due to safety filters. Please rephrase your question."
-
-            generated_text = response.text
-            print("Received response from Gemini API.")
-            return generated_text.strip()
-
-        except ValueError as ve:
-             # Handle potential API key errors during generation
-             if "API_KEY" in str(ve):
-                  print(f"Gemini API Key Error: {ve}")
-                  return "Sorry, there's an issue with the AI service configuration (API Key)."
-             else:
-                  print(f"Gemini API Value Error: {ve}")
-                  return f"Sorry, an error occurred while generating the response: {ve}"
-        except Exception as e:
-            print(f"Error calling Gemini API: {e}")
-            return "Sorry, I encountered an error while generating the response."
-
-
+            context_str = "\n---\n".join(dict.fromkeys(chunk['text'] for chunk in top_chunks if 'text' in chunk)) # Drops repeated texts, keeps rank order
+
+        prompt = render_prompt(context_str, question)
+
+        if q_vec is None:
+            return stream_gemini_answer(prompt) if stream else generate_gemini_answer(prompt)
+        if stream:
+            return _store_similar_answer_stream(stream_gemini_answer(prompt), question, q_vec, entities, chunks)
+        response = generate_gemini_answer(prompt)
+        _store_similar_answer(question, q_vec, entities, chunks, response)
+        return response
+
+# --- Gemini Calls ---
+# Safety settings sent with every request, built once. GEMINI_SAFETY_THRESHOLD overrides the threshold.
+SAFETY_THRESHOLD = os.getenv("GEMINI_SAFETY_THRESHOLD", "BLOCK_MEDIUM_AND_ABOVE")
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": SAFETY_THRESHOLD},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": SAFETY_THRESHOLD},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": SAFETY_THRESHOLD},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": SAFETY_THRESHOLD},
+]
+
+def request_gemini(prompt, stream=False):
+    """Sends the prompt to Gemini with the configured safety settings."""
+    return get_gemini_model().generate_content(prompt, safety_settings=SAFETY_SETTINGS, stream=stream)
+
+def blocked_message(response):
+    """User-facing message for a response (or stream chunk) that Gemini blocked or left empty."""
+    print("Gemini API response blocked or empty.")
+    try:
+        feedback = response.prompt_feedback
+        print(f"Prompt Feedback: {feedback}")
+        block_reason = getattr(feedback, 'block_reason', 'Unknown')
+        return f"Sorry, the request could not be completed due to safety filters (Reason: {block_reason}). Please rephrase your question."
+    except Exception:
+        return "Sorry, the request could not be completed due to safety filters. Please rephrase your question."
+
+class GeminiBlockedError(Exception):
+    """A streamed Gemini response was blocked; the exception message is user-facing."""
+
+def gemini_error_message(error):
+    """User-facing message for an exception raised while calling Gemini."""
+    if isinstance(error, GeminiBlockedError):
+        return str(error)
+    if isinstance(error, ValueError):
+        # Handle potential API key errors during generation
+        if "API_KEY" in str(error):
+            print(f"Gemini API Key Error: {error}")
+            return "Sorry, there's an issue with the AI service configuration (API Key)."
+        print(f"Gemini API Value Error: {error}")
+        return f"Sorry, an error occurred while generating the response: {error}"
+    print(f"Error calling Gemini API: {error}")
+    return "Sorry, I encountered an error while generating the response."
+
+def generate_gemini_answer(prompt):
+    """Returns Gemini's complete answer for the prompt, or an apology message on failure."""
+    print("Sending request to Gemini API...")
+    try:
+        response = request_gemini(prompt)
 
+        # Handle potential blocks or empty responses
+        if not response.candidates:
+            return blocked_message(response)
 
+        generated_text = response.text
+        print("Received response from Gemini API.")
+        return generated_text.strip()
+    except Exception as e:
+        return gemini_error_message(e)
 
+def stream_gemini_answer(prompt):
+    """
+    Yields Gemini's answer piece by piece as it is generated. A blocked prompt or chunk
+    raises GeminiBlockedError, which like any other error propagates to the consumer
+    (see answer_stream) so a partial, blocked answer is never cached.
+    """
+    print("Streaming request to Gemini API...")
+    response = request_gemini(prompt, stream=True)
+    first = True
+    for part in response:
+        if not part.candidates:
+            raise GeminiBlockedError(blocked_message(part))
+        text = part.text
+        if first:
+            text = text.lstrip()
+            first = False
+        if text:
+            yield text
+    print("Received streamed response from Gemini API.")
@@ -1,4 +1,5 @@
 import json # Import json module if not already imported
+import sys
 
 def build_dish_chunks(restaurants):
     """
@@ -9,7 +10,8 @@ def build_dish_chunks(restaurants):
     chunks = []
     for resto in restaurants:
         # --- Get restaurant-level info ---
-        resto_name = resto.get('name', '')
+        resto_name = sys.intern(resto.get('name', '')) # Shared by every dish chunk of this restaurant
+        resto_id_lc = sys.intern(resto_name.lower())
         dietary_options = resto.get('dietary_options', [])
         price_range = resto.get('price_range', '')
         address = resto.get('address', '')
@@ -38,18 +40,16 @@ def build_dish_chunks(restaurants):
         # ------------------------------------------
 
         for item in resto.get('menu_items', []): # Use 'menu_items' based on knowledgebase.json
-            dish_name = item['name']
+            dish_name = sys.intern(item['name'])
             desc      = item.get('description', '')
             price     = item.get('price', None)
             attrs     = item.get('attributes', {})
 
             # --- Build the text blob for the chunk ---
-            # Start with dish info
-            dish_info = f"Dish: {dish_name}"
-            if desc:
-                 dish_info += f": {desc}"
+            # Collect the sentences and join them once instead of growing a string
+            text_parts = [resto_info, f"Dish: {dish_name}: {desc}" if desc else f"Dish: {dish_name}"]
             if price is not None:
-                dish_info += f". Price ₹{price}"
+                text_parts.append(f"Price ₹{price}")
 
             # Add dish attributes
             tag_parts = []
@@ -66,16 +66,19 @@ def build_dish_chunks(restaurants):
                 # Add other boolean attributes or specific string attributes if needed
 
             if tag_parts:
-                dish_info += ". Attributes: " + ", ".join(tag_parts)
+                text_parts.append("Attributes: " + ", ".join(tag_parts))
 
             # Combine restaurant info and dish info for the final text chunk
-            txt = f"{resto_info}. {dish_info}."
+            txt = ". ".join(text_parts) + "."
             # ------------------------------------------
 
             # --- Create the chunk dictionary with metadata ---
             chunk_metadata = {
                 'resto_name': resto_name,
+                'resto_id': resto_name, # Key the chatbot uses to group and look up dishes by restaurant
                 'dish_name': dish_name,
+                'resto_id_lc': resto_id_lc, # Lowercased keys for case-insensitive lookups
+                'dish_name_lc': sys.intern(dish_name.lower()),
                 'text': txt, # The combined text blob
                 # Restaurant metadata
                 'dietary_options': dietary_options,
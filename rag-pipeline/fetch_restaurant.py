@@ -1,15 +1,23 @@
 import json
 import os
 
-def load_restaurants(json_path=r'D:\rag-restaurant-assistant\data\processed\knowledgebase.json'):
+try:
+    import orjson # Optional: parses the knowledge base several times faster than json
+except ImportError:
+    orjson = None
+
+def load_restaurants(json_path=None):
     '''
     Load the list of restaurants from a JSON file.
-    If json_path is None, defaults to data/restaurants.json.
+    If json_path is None, defaults to data/processed/knowledgebase.json.
     '''
     
     if json_path is None:
-        base = os.path.dirname(__file__)
-        json_path = os.path.join(base, '..', 'data', 'restaurants.json')
+        base = os.path.dirname(os.path.abspath(__file__))
+        json_path = os.path.join(base, '..', 'data', 'processed', 'knowledgebase.json')
+    if orjson is not None:
+        with open(json_path, 'rb') as f:
+            return orjson.loads(f.read())
     with open(json_path, 'r', encoding='utf-8') as f:
         return json.load(f)
     
@@ -1,140 +1,409 @@
+import os
+
+# Intra-op thread count for torch/OpenMP/MKL. The env vars must be set before
+# those libraries are imported, so this block stays above the heavy imports.
+NUM_THREADS = int(os.getenv('NUM_THREADS', str(os.cpu_count() or 4)))
+os.environ.setdefault('OMP_NUM_THREADS', str(NUM_THREADS))
+os.environ.setdefault('MKL_NUM_THREADS', str(NUM_THREADS))
+
 import numpy as np
 import faiss
 from sentence_transformers import SentenceTransformer
 import torch
+import functools
+import hashlib
 import logging
-import os
+import math
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+torch.set_num_threads(NUM_THREADS)
+try:
+    torch.set_num_interop_threads(1)
+except RuntimeError:
+    pass # Already fixed once inter-op work has started in this process
+
+logger = logging.getLogger(__name__)
+
+# Number of chunk texts encoded per forward pass. SentenceTransformer.encode
+# length-sorts its input before batching, so larger batches waste little on padding.
+EMBED_BATCH_SIZE = int(os.getenv('EMBED_BATCH_SIZE', '64'))
+EMBED_BATCH_SIZE_GPU = int(os.getenv('EMBED_BATCH_SIZE_GPU', '256'))
+# Run the torch embedder in half precision on CUDA (roughly halves encode time and memory traffic).
+EMBED_FP16 = os.getenv('EMBED_FP16', '1') == '1'
+# bfloat16 on CPU only pays off with native BF16 support (AVX512-BF16 / AMX); elsewhere it is slower, so opt-in.
+EMBED_CPU_BF16 = os.getenv('EMBED_CPU_BF16', '0') == '1'
+# Dynamic int8 quantization of the Linear layers on CPU (VNNI-friendly, ~2x encode throughput);
+# opt-in since it perturbs embeddings slightly. Takes precedence over EMBED_CPU_BF16.
+EMBED_CPU_INT8 = os.getenv('EMBED_CPU_INT8', '0') == '1'
+
+# FAISS index selection: 'flat' (exact), 'sq8' (int8 scalar quantized, exhaustive),
+# 'hnsw' (graph-based, approximate), 'ivfflat' (inverted lists over full vectors),
+# 'ivfpq' (compressed, approximate) or 'auto', which moves to IVF-Flat and then
+# IVF-PQ as the catalogue grows.
+FAISS_INDEX_TYPE = os.getenv('FAISS_INDEX_TYPE', 'auto')
+# Embeddings are L2-normalized, so inner product equals cosine similarity and ranks
+# exactly like L2 distance while skipping the subtract/square per dimension.
+FAISS_METRIC = 'inner_product'
+HNSW_M = 32                # graph neighbours per node
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64        # floor; each search uses max(2k, HNSW_EF_SEARCH) (see search_params)
+IVFFLAT_NLIST = 100
+IVFFLAT_NPROBE = 10
+IVFFLAT_MIN_VECTORS = 39 * IVFFLAT_NLIST # FAISS wants ~39 training points per list
+IVFPQ_MIN_VECTORS = 10000
+IVFPQ_M = 48       # sub-quantizers; must divide the embedding dimension (384 for MiniLM)
+IVFPQ_NBITS = 8
+IVFPQ_NPROBE = 8
+
+# Move the index to the GPU only for large catalogues; below this, the PCIe round
+# trip per query costs more than a CPU (AVX2) scan.
+GPU_INDEX_MIN_VECTORS = 10000
+_gpu_resources = None
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Inference backend for the embedder: 'torch', or 'onnx' / 'openvino' to run the
+# exported graph (sentence-transformers >= 3.2; the all-MiniLM-L6-v2 hub repo ships one).
+EMBED_BACKEND = os.getenv('EMBED_BACKEND', 'torch')
+# Optional graph file within the model repo for the onnx/openvino backends, e.g.
+# 'onnx/model_qint8_avx2.onnx' for the INT8-quantized MiniLM (about 2x faster on CPU).
+EMBED_MODEL_FILE = os.getenv('EMBED_MODEL_FILE', '')
+
+# Storage dtype of the embedding matrix kept for filtered searches. Unit-norm vectors
+# lose nothing that matters for ranking in float16, and it halves memory and disk use.
+FILTER_EMBED_DTYPE = np.dtype(os.getenv('FILTER_EMBED_DTYPE', 'float16'))
+
+# Built indexes are persisted here, keyed by a hash of the chunk texts, so restarts
+# with unchanged data memory-map the saved index instead of re-embedding everything.
+INDEX_CACHE_DIR = os.getenv('INDEX_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'index_cache'))
 
 def get_sentence_transformer_cache_dir():
     cache_home = os.getenv('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
     return os.path.join(cache_home, 'torch', 'sentence_transformers')
 
-def create_faiss_index(chunks, model_name='all-MiniLM-L6-v2'):
-    if not chunks:
-        logging.error("No chunks provided to create_faiss_index.")
-        return None, None
+def load_sentence_transformer(model_name, device):
+    """Instantiates the embedder on `device` with the configured inference backend."""
+    if EMBED_BACKEND == 'torch':
+        return SentenceTransformer(model_name, device=device)
+    model_kwargs = {'file_name': EMBED_MODEL_FILE} if EMBED_MODEL_FILE else None
+    return SentenceTransformer(model_name, device=device, backend=EMBED_BACKEND, model_kwargs=model_kwargs)
 
-    texts = [c.get('text', '') for c in chunks]
+def index_cache_path(texts, model_name, index_type, cache_dir):
+    """Path of the persisted index for these chunk texts, model and index type."""
+    digest = hashlib.sha256()
+    # Everything that changes the stored vectors is part of the key, including the embedder's precision settings
+    precision = f"fp16={EMBED_FP16},bf16={EMBED_CPU_BF16},int8={EMBED_CPU_INT8}"
+    digest.update(f"{model_name}|{index_type}|{FAISS_METRIC}|{EMBED_BACKEND}|{EMBED_MODEL_FILE}|{precision}".encode('utf-8'))
+    for text in texts:
+        digest.update(b'\0')
+        digest.update(text.encode('utf-8'))
+    return os.path.join(cache_dir, f"{digest.hexdigest()[:16]}.faiss")
+
+def embeddings_cache_path(cache_path):
+    """The exact chunk embeddings are stored next to the persisted index."""
+    return os.path.splitext(cache_path)[0] + '.npy'
+
+def attach_embeddings(index, embeddings):
+    """Keeps the (ntotal, dim) chunk embeddings on the index object for index_vectors()."""
+    if embeddings is not None and len(embeddings) == index.ntotal:
+        index.embeddings = np.asarray(embeddings, dtype=FILTER_EMBED_DTYPE) # No copy when already stored in this dtype
+    return index
+
+_embed_model_lock = threading.Lock()
 
-    cache_dir = get_sentence_transformer_cache_dir()
-    logging.info(f"Expected Sentence Transformer cache directory: {cache_dir}")
-    if not os.path.exists(cache_dir):
-        logging.warning(f"Cache directory does not exist. Model will be downloaded.")
+@functools.lru_cache(maxsize=None)
+def _load_embedding_model(model_name):
+    st_cache_dir = get_sentence_transformer_cache_dir()
+    logger.info("Expected Sentence Transformer cache directory: %s", st_cache_dir)
+    if not os.path.exists(st_cache_dir):
+        logger.warning("Cache directory does not exist. Model will be downloaded.")
     else:
-        logging.info(f"Cache directory exists.")
+        logger.info("Cache directory exists.")
 
     if torch.cuda.is_available():
         device = torch.device('cuda')
     else:
         device = torch.device('cpu')
-    logging.info(f"Attempting to load model on device: {device}")
+    logger.info("Attempting to load model on device: %s", device)
 
     embed_model = None
     try:
-        embed_model = SentenceTransformer(model_name, device=device)
-        logging.info(f"SentenceTransformer '{model_name}' loaded successfully on {device}.")
+        embed_model = load_sentence_transformer(model_name, device)
+        logger.info("SentenceTransformer '%s' (%s backend) loaded successfully on %s.", model_name, EMBED_BACKEND, device)
     except Exception as e:
-        logging.exception(f"Initial attempt to load SentenceTransformer '{model_name}' on device {device} FAILED. Original error:")
+        logger.exception("Initial attempt to load SentenceTransformer '%s' on device %s FAILED. Original error:", model_name, device)
         if device != torch.device('cpu'):
-            logging.warning("Attempting to load SentenceTransformer on CPU as fallback...")
+            logger.warning("Attempting to load SentenceTransformer on CPU as fallback...")
             device = torch.device('cpu')
             try:
-                embed_model = SentenceTransformer(model_name, device=device)
-                logging.info(f"SentenceTransformer '{model_name}' loaded successfully on CPU (fallback).")
+                embed_model = load_sentence_transformer(model_name, device)
+                logger.info("SentenceTransformer '%s' loaded successfully on CPU (fallback).", model_name)
             except Exception as e_cpu:
-                logging.exception(f"Fallback attempt to load SentenceTransformer '{model_name}' on CPU ALSO FAILED. Original error:")
+                logger.exception("Fallback attempt to load SentenceTransformer '%s' on CPU ALSO FAILED. Original error:", model_name)
                 raise RuntimeError(f"Could not load SentenceTransformer '{model_name}' on any available device. See logged exceptions for details.") from e_cpu
         else:
              raise RuntimeError(f"Could not load SentenceTransformer '{model_name}' on CPU. See logged exception for details.") from e
 
+    # Inference only: disable dropout/autograd bookkeeping, then run one tiny encode so
+    # lazy initialisation (kernels, tokenizer caches) happens here and not on the first query.
+    embed_model.eval()
+    if EMBED_FP16 and EMBED_BACKEND == 'torch' and embed_model.device.type == 'cuda':
+        embed_model.half()
+        logger.info("Running '%s' in FP16 on %s.", model_name, embed_model.device)
+    elif EMBED_CPU_INT8 and EMBED_BACKEND == 'torch' and embed_model.device.type == 'cpu':
+        embed_model = torch.ao.quantization.quantize_dynamic(embed_model, {torch.nn.Linear}, dtype=torch.qint8)
+        logger.info("Running '%s' with dynamic int8 Linear layers on CPU.", model_name)
+    elif EMBED_CPU_BF16 and EMBED_BACKEND == 'torch' and embed_model.device.type == 'cpu':
+        embed_model.to(torch.bfloat16)
+        logger.info("Running '%s' in BF16 on CPU.", model_name)
     try:
-        logging.info(f"Generating embeddings for {len(texts)} chunks using device {embed_model.device}...")
+        embed_model.encode(["warm-up"], normalize_embeddings=True, device=embed_model.device)
+    except Exception as e:
+        logger.warning("Warm-up encode for '%s' failed: %s", model_name, e)
+    return embed_model
+
+def load_embedding_model(model_name='all-MiniLM-L6-v2'):
+    """
+    Returns the process-wide SentenceTransformer for `model_name`, loading and
+    warming it up on first use. Every caller in the process (index builds, reruns,
+    concurrent Streamlit sessions) shares one copy of the weights.
+    """
+    with _embed_model_lock:
+        return _load_embedding_model(model_name)
+
+def build_faiss_index(embeddings_np, index_type=FAISS_INDEX_TYPE):
+    """Builds and populates a FAISS index of the requested type from float32 embeddings."""
+    num_vectors, dim = embeddings_np.shape
+    if index_type == 'auto':
+        if num_vectors >= IVFPQ_MIN_VECTORS:
+            index_type = 'ivfpq'
+        elif num_vectors >= IVFFLAT_MIN_VECTORS:
+            index_type = 'ivfflat'
+        else:
+            index_type = 'flat'
+
+    if index_type == 'flat':
+        logger.info("Creating FAISS IndexFlatIP with dimension %s.", dim)
+        index = faiss.IndexFlatIP(dim)
+        index.add(embeddings_np)
+    elif index_type == 'sq8':
+        logger.info("Creating FAISS IndexScalarQuantizer (QT_8bit) with dimension %s.", dim)
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        index.train(embeddings_np)
+        index.add(embeddings_np)
+    elif index_type == 'hnsw':
+        logger.info("Creating FAISS IndexHNSWFlat with dimension %s, M=%s.", dim, HNSW_M)
+        index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.add(embeddings_np)
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif index_type == 'ivfflat':
+        nlist = max(1, min(IVFFLAT_NLIST, num_vectors // 39))
+        logger.info("Creating FAISS IndexIVFFlat with dimension %s, nlist=%s.", dim, nlist)
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(embeddings_np)
+        index.add(embeddings_np)
+        index.nprobe = min(IVFFLAT_NPROBE, nlist)
+        index.make_direct_map() # Filtered search reconstructs vectors by id
+    elif index_type == 'ivfpq':
+        if dim % IVFPQ_M != 0:
+            raise ValueError(f"IVF-PQ needs the dimension ({dim}) to be divisible by M={IVFPQ_M}.")
+        nlist = max(1, int(math.sqrt(num_vectors)))
+        logger.info("Creating FAISS IndexIVFPQ with dimension %s, nlist=%s, M=%s, nbits=%s.", dim, nlist, IVFPQ_M, IVFPQ_NBITS)
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, IVFPQ_M, IVFPQ_NBITS, faiss.METRIC_INNER_PRODUCT)
+        index.train(embeddings_np)
+        index.add(embeddings_np)
+        index.nprobe = IVFPQ_NPROBE
+        index.make_direct_map() # Filtered search reconstructs vectors by id
+    else:
+        raise ValueError(f"Unknown FAISS index type '{index_type}'.")
+    return index
+
+def search_params(index, k):
+    """
+    Per-call search parameters for `index`, or None for the index defaults. HNSW
+    recall drops once k approaches efSearch, so the beam is widened with k; passing
+    it per call leaves the shared index untouched across threads.
+    """
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=max(2 * k, HNSW_EF_SEARCH))
+    return None
+
+def move_index_to_gpu(index):
+    """Returns a GPU copy of `index` when a FAISS GPU build and device are available and the index is large enough."""
+    global _gpu_resources
+    if index.ntotal < GPU_INDEX_MIN_VECTORS or not hasattr(faiss, 'StandardGpuResources') or faiss.get_num_gpus() == 0:
+        return index
+    try:
+        if _gpu_resources is None:
+            _gpu_resources = faiss.StandardGpuResources()
+        gpu_index = faiss.index_cpu_to_gpu(_gpu_resources, 0, index)
+        logger.info("Moved FAISS index (%s vectors) to GPU 0.", index.ntotal)
+        return gpu_index
+    except Exception as e:
+        logger.warning("Could not move %s to GPU, searching on CPU: %s", type(index).__name__, e)
+        return index
+
+def create_faiss_index(chunks, model_name='all-MiniLM-L6-v2', batch_size=None, index_type=FAISS_INDEX_TYPE, cache_dir=None):
+    if not chunks:
+        logger.error("No chunks provided to create_faiss_index.")
+        return None, None
+
+    texts = [c.get('text', '') for c in chunks]
+
+    embed_model = load_embedding_model(model_name)
+
+    cache_path = index_cache_path(texts, model_name, index_type, cache_dir) if cache_dir else None
+    if cache_path and os.path.exists(cache_path):
+        try:
+            index = faiss.read_index(cache_path, faiss.IO_FLAG_MMAP)
+            if index.ntotal == len(texts):
+                logger.info("Loaded persisted FAISS index (%s vectors) from %s.", index.ntotal, cache_path)
+                embeddings_path = embeddings_cache_path(cache_path)
+                embeddings_np = np.load(embeddings_path, mmap_mode='r') if os.path.exists(embeddings_path) else None
+                return embed_model, attach_embeddings(move_index_to_gpu(index), embeddings_np)
+            logger.warning("Persisted FAISS index at %s has %s vectors, expected %s. Rebuilding.", cache_path, index.ntotal, len(texts))
+        except Exception as e:
+            logger.warning("Could not load persisted FAISS index from %s: %s. Rebuilding.", cache_path, e)
+
+    if batch_size is None:
+        batch_size = EMBED_BATCH_SIZE_GPU if embed_model.device.type == 'cuda' else EMBED_BATCH_SIZE
+
+    try:
+        logger.info("Generating embeddings for %s chunks using device %s (batch size %s)...", len(texts), embed_model.device, batch_size)
         embeddings = embed_model.encode(
             texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
             normalize_embeddings=True,
             device=embed_model.device,
             show_progress_bar=True
         )
-        logging.info("Embeddings generated successfully.")
+        logger.info("Embeddings generated successfully.")
     except Exception as e:
-        logging.error(f"Error generating embeddings: {e}", exc_info=True)
+        logger.error("Error generating embeddings: %s", e, exc_info=True)
         raise RuntimeError("Failed to generate embeddings.") from e
 
     try:
-        dim = embeddings.shape[1]
-        logging.info(f"Creating FAISS IndexFlatL2 with dimension {dim}.")
-        embeddings_np = np.array(embeddings, dtype='float32')
-        if np.isnan(embeddings_np).any() or np.isinf(embeddings_np).any():
-             logging.error("Embeddings contain NaN or Inf values. Cannot add to FAISS index.")
+        embeddings_np = np.ascontiguousarray(embeddings, dtype=np.float32) # No copy: encode already returns C-contiguous float32
+        if not np.isfinite(embeddings_np).all():
+             logger.error("Embeddings contain NaN or Inf values. Cannot add to FAISS index.")
              raise ValueError("Invalid values (NaN/Inf) found in embeddings.")
 
-        index = faiss.IndexFlatL2(dim)
-        index.add(embeddings_np)
-        logging.info(f"FAISS IndexFlatL2 created and {index.ntotal} vectors added.")
+        index = build_faiss_index(embeddings_np, index_type=index_type)
+        logger.info("FAISS %s created and %s vectors added.", type(index).__name__, index.ntotal)
     except Exception as e:
-        logging.error(f"Error creating or adding to FAISS index: {e}", exc_info=True)
+        logger.error("Error creating or adding to FAISS index: %s", e, exc_info=True)
         raise RuntimeError("Failed to create or populate FAISS index.") from e
 
-    return embed_model, index
+    if cache_path:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.save(f, embeddings_np.astype(FILTER_EMBED_DTYPE))
+            os.replace(tmp_path, embeddings_cache_path(cache_path)) # Written first: the index file marks a complete entry
+            faiss.write_index(index, tmp_path)
+            os.replace(tmp_path, cache_path) # Atomic, so concurrent workers never read a partial file
+            logger.info("Persisted FAISS index and embeddings to %s.", cache_path)
+        except Exception as e:
+            logger.warning("Could not persist FAISS index to %s: %s", cache_path, e)
+
+    return embed_model, attach_embeddings(move_index_to_gpu(index), embeddings_np)
+
+def index_vectors(index):
+    """
+    All vectors stored in `index` as a normalized (ntotal, dim) FILTER_EMBED_DTYPE matrix
+    for the filtered-search path: the original embeddings when attached (see
+    create_faiss_index), otherwise reconstructed once and attached to the index, so the
+    matrix is freed together with it.
+    """
+    stored = getattr(index, 'embeddings', None)
+    if stored is not None:
+        return stored
+    vectors = np.ascontiguousarray(index.reconstruct_n(0, index.ntotal), dtype='float32')
+    if not isinstance(index, (faiss.IndexFlat, faiss.IndexHNSWFlat, faiss.IndexIVFFlat)):
+        faiss.normalize_L2(vectors) # Only quantized indexes reconstruct approximately; the others return the stored unit vectors
+    attach_embeddings(index, vectors)
+    return getattr(index, 'embeddings', vectors.astype(FILTER_EMBED_DTYPE, copy=False))
 
-def retrieve_chunks(query, embed_model, index, chunks, k=50, filter_indices=None):
+QUERY_EMBED_CACHE_SIZE = 2048
+
+@functools.lru_cache(maxsize=QUERY_EMBED_CACHE_SIZE)
+def _embed_query_cached(embed_model, query):
+    with torch.inference_mode():
+        q_emb_np = np.ascontiguousarray(embed_model.encode([query], convert_to_numpy=True, normalize_embeddings=True, device=embed_model.device), dtype=np.float32)
+    q_emb_np.setflags(write=False) # Shared between callers
+    return q_emb_np
+
+def embed_query(query, embed_model):
+    """
+    Returns the normalized (1, dim) float32 embedding for a query. Repeated queries
+    (after whitespace normalization) skip the encoder; the array is read-only.
+    """
+    return _embed_query_cached(embed_model, " ".join(query.split()))
+
+def retrieve_chunks(query, embed_model, index, chunks, k=50, filter_indices=None, sort_results=True):
+    """
+    Top-k chunks for `query`, optionally restricted to `filter_indices`. With
+    sort_results=False a filtered search returns its top k in arbitrary order,
+    skipping the final sort (for callers that re-rank anyway).
+    """
     if not query or embed_model is None or index is None or chunks is None:
-        logging.warning("retrieve_chunks called with invalid arguments.")
+        logger.warning("retrieve_chunks called with invalid arguments.")
         return []
 
     device = embed_model.device
-    logging.info(f"Retrieving chunks for query using device {device}")
+    logger.info("Retrieving chunks for query using device %s", device)
 
     try:
-        q_emb = embed_model.encode([query], normalize_embeddings=True, device=device)
-        q_emb_np = np.array(q_emb, dtype='float32')
-        if np.isnan(q_emb_np).any() or np.isinf(q_emb_np).any():
-             logging.error("Query embedding contains NaN or Inf values.")
+        q_emb_np = embed_query(query, embed_model)
+        if not np.isfinite(q_emb_np).all():
+             logger.error("Query embedding contains NaN or Inf values.")
              return []
     except Exception as e:
-        logging.error(f"Error encoding query '{query}': {e}", exc_info=True)
+        logger.error("Error encoding query '%s': %s", query, e, exc_info=True)
         return []
 
     selected_indices = []
     try:
         if filter_indices is not None:
-            logging.info(f"Performing filtered L2 search within {len(filter_indices)} indices.")
-            valid_filter_indices = [int(i) for i in filter_indices if isinstance(i, (int, np.integer)) and 0 <= i < index.ntotal]
-            if not valid_filter_indices:
-                logging.warning("No valid indices remaining after filtering.")
+            logger.info("Performing filtered inner-product search within %s indices.", len(filter_indices))
+            candidates = np.asarray(filter_indices, dtype=np.int64).ravel() # Non-integer input raises and is logged below
+            candidates = candidates[(candidates >= 0) & (candidates < index.ntotal)]
+            if candidates.size == 0:
+                logger.warning("No valid indices remaining after filtering.")
                 return []
             try:
-                 sub_embs = np.array([index.reconstruct(i) for i in valid_filter_indices], dtype='float32')
+                 sub_embs = index_vectors(index)[candidates].astype(np.float32, copy=False) # BLAS gemv needs float32
                  if sub_embs.size == 0:
-                     logging.warning("Filtered indices resulted in zero embeddings for reconstruction.")
+                     logger.warning("Filtered indices resulted in zero embeddings for reconstruction.")
                      return []
 
-                 faiss.normalize_L2(sub_embs)
-
-                 temp_index = faiss.IndexFlatL2(sub_embs.shape[1])
-                 temp_index.add(sub_embs)
-                 k_search = min(k, len(valid_filter_indices))
-                 distances, temp_indices = temp_index.search(q_emb_np, k_search)
-
-                 if temp_indices.size > 0:
-                     selected_indices = [valid_filter_indices[i] for i in temp_indices[0] if i >= 0]
+                 # Exact scores over the subset; argpartition selects the top k in O(n) before sorting just those
+                 scores = sub_embs @ q_emb_np[0]
+                 k_search = min(k, len(candidates))
+                 top = np.argpartition(-scores, k_search - 1)[:k_search]
+                 if sort_results:
+                     top = top[np.argsort(-scores[top], kind='stable')]
+                 selected_indices = candidates[top].tolist()
 
             except Exception as e_rec:
-                 logging.error(f"Error reconstructing/searching filtered embeddings: {e_rec}", exc_info=True)
+                 logger.error("Error reconstructing/searching filtered embeddings: %s", e_rec, exc_info=True)
                  return []
         else:
-            logging.info(f"Performing L2 search on the main index for top {k} results.")
-            distances, direct_indices = index.search(q_emb_np, k)
-            if direct_indices.size > 0:
-                selected_indices = [i for i in direct_indices[0] if i >= 0]
+            logger.info("Performing inner-product search on the main index for top %s results.", k)
+            _, direct_indices = index.search(q_emb_np, k, params=search_params(index, k))
+            selected_indices = [int(i) for i in direct_indices[0] if i >= 0]
 
     except Exception as e_search:
-        logging.error(f"Error during FAISS search: {e_search}", exc_info=True)
+        logger.error("Error during FAISS search: %s", e_search, exc_info=True)
         return []
 
-    logging.info(f"FAISS search returned {len(selected_indices)} potential indices: {selected_indices}")
+    logger.info("FAISS search returned %s potential indices: %s", len(selected_indices), selected_indices)
 
     final_results = []
     num_chunks = len(chunks)
@@ -142,7 +411,93 @@ def retrieve_chunks(query, embed_model, index, chunks, k=50, filter_indices=None
         if 0 <= idx < num_chunks:
             final_results.append(chunks[idx])
         else:
-            logging.warning(f"Index {idx} from search result is out of bounds for chunks list (size {num_chunks}). Skipping.")
+            logger.warning("Index %s from search result is out of bounds for chunks list (size %s). Skipping.", idx, num_chunks)
 
-    logging.info(f"Returning {len(final_results)} retrieved chunks.")
+    logger.info("Returning %s retrieved chunks.", len(final_results))
     return final_results
+
+# --- Coalesced Retrieval ---
+# Concurrent callers (e.g. several Streamlit sessions hitting the Gemini fallback)
+# are collected for up to RETRIEVAL_BATCH_WAIT seconds and served by one FAISS search.
+RETRIEVAL_BATCH_WAIT = float(os.getenv('RETRIEVAL_BATCH_WAIT', '0.005'))
+RETRIEVAL_BATCH_MAX = 32
+# Callers stop waiting on the worker after this many seconds and search directly
+RETRIEVAL_RESULT_TIMEOUT = float(os.getenv('RETRIEVAL_RESULT_TIMEOUT', '10'))
+_retrieval_queue = queue.Queue()
+_retrieval_worker = None
+_retrieval_worker_lock = threading.Lock()
+
+def _collect_retrieval_batch():
+    batch = [_retrieval_queue.get()]
+    deadline = time.monotonic() + RETRIEVAL_BATCH_WAIT
+    while len(batch) < RETRIEVAL_BATCH_MAX:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(_retrieval_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+def _search_retrieval_group(requests, embed_model, index, chunks, k):
+    """Answers one group of queued requests that share a model, index, chunks and k."""
+    try:
+        q_embs_np = np.vstack([embed_query(query, embed_model) for query, _ in requests])
+        finite_rows = np.isfinite(q_embs_np).all(axis=1)
+        if not finite_rows.all():
+            logger.error("%s query embeddings contain NaN or Inf values. Skipping them.", int((~finite_rows).sum()))
+        batch_indices = []
+        if finite_rows.any():
+            logger.info("Performing coalesced inner-product search for %s queries, top %s each.", int(finite_rows.sum()), k)
+            _, batch_indices = index.search(np.ascontiguousarray(q_embs_np[finite_rows]), k, params=search_params(index, k))
+    except Exception as e:
+        logger.error("Error during coalesced FAISS search: %s", e, exc_info=True)
+        for _, future in requests:
+            future.set_result([])
+        return
+
+    num_chunks = len(chunks)
+    rows = iter(batch_indices) # One row per finite query, in request order
+    for (_, future), ok in zip(requests, finite_rows):
+        future.set_result([chunks[i] for i in next(rows) if 0 <= i < num_chunks] if ok else [])
+
+def _retrieval_worker_loop():
+    while True:
+        batch = _collect_retrieval_batch()
+        try:
+            groups = {}
+            for query, embed_model, index, chunks, k, future in batch:
+                key = (id(embed_model), id(index), id(chunks), k)
+                groups.setdefault(key, (embed_model, index, chunks, k, []))[4].append((query, future))
+            for embed_model, index, chunks, k, requests in groups.values():
+                _search_retrieval_group(requests, embed_model, index, chunks, k)
+        except Exception as e:
+            # Keep the worker alive and release every caller still waiting on this batch
+            logger.error("Coalesced retrieval worker failed: %s", e, exc_info=True)
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+def retrieve_chunks_coalesced(query, embed_model, index, chunks, k=50):
+    """
+    Same results as retrieve_chunks(query, ...) without filtering, but concurrent
+    calls are batched into a single index.search by a background worker thread.
+    """
+    global _retrieval_worker
+    if not query or embed_model is None or index is None or chunks is None:
+        logger.warning("retrieve_chunks_coalesced called with invalid arguments.")
+        return []
+
+    with _retrieval_worker_lock:
+        if _retrieval_worker is None or not _retrieval_worker.is_alive():
+            _retrieval_worker = threading.Thread(target=_retrieval_worker_loop, name='faiss-retrieval-batcher', daemon=True)
+            _retrieval_worker.start()
+
+    future = Future()
+    _retrieval_queue.put((query, embed_model, index, chunks, k, future))
+    try:
+        return future.result(timeout=RETRIEVAL_RESULT_TIMEOUT)
+    except Exception as e:
+        logger.warning("Coalesced retrieval failed (%r); searching directly.", e)
+        return retrieve_chunks(query, embed_model, index, chunks, k=k)
@@ -1,55 +1,171 @@
 import re
+import string
+import functools
 import logging
-
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+PARSE_CACHE_SIZE = 1024
+
+# --- Query Spec ---
+# Parsed specs are immutable so the parse cache can hand the same instance to every caller.
+# Only the fields of the matched intent are set; the rest keep their defaults.
+QuerySpec = namedtuple(
+    'QuerySpec',
+    'price_lt dietary spice_cmp restaurant dish_price_query feature_compare price_range_query',
+    defaults=(None, (), None, None, None, None, None)
+)
+SpiceComparison = namedtuple('SpiceComparison', 'dish restaurants')
+FeatureComparison = namedtuple('FeatureComparison', 'restaurants feature qualifier')
+
+# --- Compiled Patterns ---
+# Patterns are written in lowercase and matched against the lowercased question, so the
+# engine doesn't case-fold every character; captured names are sliced from the original
+# question by match offsets to keep the user's casing.
+_DISH_PRICE_RE = re.compile(r"(?:price|prices|cost|how much is|how much are)\s+(?:of|for)?\s+(.+?)(?:\s+across|\s+at all|\s+in all|\?|$)")
+_SPICE_CMP_RE = re.compile(r"compare spice.*? dish (.+?) between (.+?) and (.+)")
+_COMPARE_RES = (
+    re.compile(r"(?:compare|difference)\s+(?:(?:rating|price range)\s+)?(?:between|for)\s+(.+?)\s+and\s+(.+)"),
+    re.compile(r"which is (better|higher rated|cheaper|more expensive)\s*,?\s*(.+?)\s+or\s+(.+)"),
+    re.compile(r"what'?s the (rating|price)\s*(?:difference|range)?\s*(?:between|for)\s+(.+?)\s+and\s+(.+)"),
+)
+_PRICE_RANGE_RES = (
+    re.compile(r"(?:is|are)\s+(.+?)\s+(expensive|cheap|pricey|mid-range|affordable)\b"),
+    re.compile(r"what'?s the price range for\s+(.+)"),
+    re.compile(r"how expensive is\s+(.+)"),
+)
+_RESTO_RES = (
+    re.compile(r"(?:menu|dishes)\s+(?:at|in|from)\s+(.+)"),
+    re.compile(r"(.+?)\s+(?:menu|dishes)"),
+)
+_PRICE_LT_RE = re.compile(r"(?:under|less than|below)\s*₹?(\d+)")
+_WORD_RE = re.compile(r"[a-z]+")
+
+# Whole words that pick the compared feature and its qualifier
+_RATING_WORDS = frozenset(('rating', 'rated', 'better'))
+_HIGHER_WORDS = frozenset(('better', 'higher'))
+_PRICE_WORDS = frozenset(('price', 'cheaper', 'expensive'))
+# Dietary tags, reported in this order.
+DIETARY_TAGS = ('vegan', 'gluten_free', 'vegetarian')
+
+# Substrings (lowercase) at least one of which must occur for the matching pattern(s)
+# above to have a chance; checking them first skips the regex engine on most questions.
+_DISH_PRICE_KEYS = ('price', 'cost', 'how much')
+_SPICE_CMP_KEYS = ('compare spice',)
+_COMPARE_KEYS = ('compare', 'difference', 'which is', 'what')
+_PRICE_RANGE_KEYS = ('expensive', 'cheap', 'pricey', 'mid-range', 'affordable', 'price range for')
+_RESTO_KEYS = ('menu', 'dishes')
+_PRICE_LT_KEYS = ('under', 'less than', 'below')
+_DIETARY_KEYS = ('vegan', 'gluten', 'vegetarian')
+
+def _mentions(text_lower, keys):
+    return any(key in text_lower for key in keys)
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == '_' # Same definition as the regex \w
+
+def _ends_word(text, end):
+    return end == len(text) or not _is_word_char(text[end])
+
+def _has_word(text, word):
+    """Equivalent of re.search(rf'\b{word}\b', text) for an alphanumeric word, using str.find."""
+    start = text.find(word)
+    while start != -1:
+        if (start == 0 or not _is_word_char(text[start - 1])) and _ends_word(text, start + len(word)):
+            return True
+        start = text.find(word, start + 1)
+    return False
+
+def _has_gluten_free(text):
+    """Equivalent of re.search(r'gluten[\s-]?free\b', text)."""
+    start = text.find('gluten')
+    while start != -1:
+        i = start + len('gluten')
+        if i < len(text) and (text[i].isspace() or text[i] == '-'):
+            if text.startswith('free', i + 1) and _ends_word(text, i + 5):
+                return True
+        if text.startswith('free', i) and _ends_word(text, i + 4):
+            return True
+        start = text.find('gluten', start + 1)
+    return False
+
+_DIETARY_CHECKS = {
+    'vegan': lambda text: _has_word(text, 'vegan'),
+    'gluten_free': _has_gluten_free,
+    'vegetarian': lambda text: _has_word(text, 'vegetarian'),
+}
+
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+def _lower_aligned(question):
+    """Lowercased question with the same length as the original, so match offsets carry over."""
+    question_lower = question.lower()
+    if len(question_lower) != len(question): # A few non-ASCII characters change length when lowered
+        question_lower = question.translate(_ASCII_LOWER)
+    return question_lower
+
+def _original(question, match, group):
+    """Text of `group` from the original-cased question."""
+    return question[match.start(group):match.end(group)]
+
+def _clean_name(text):
+    """Strips whitespace and trailing punctuation from a captured name; None unless 3-49 chars long."""
+    name = text.strip().rstrip('.?!')
+    return name if 2 < len(name) < 50 else None
+
+def _search_any(patterns, text):
+    """First match of the patterns, tried in order (like chaining re.search calls with `or`)."""
+    for pattern in patterns:
+        match = pattern.search(text)
+        if match:
+            return match
+    return None
 
 def parse_query(question):
+    """
+    Parses a question into a QuerySpec. Results are memoized on the stripped question;
+    specs are immutable, so repeated questions share one cached instance.
+    """
+    return _parse_query_cached(question.strip())
 
-    spec = {
-        'price_lt': None,
-        'dietary': [],
-        'spice_cmp': None,
-        'restaurant': None,
-        'dish_price_query': None,
-        'feature_compare': None,
-        'price_range_query': None
-    }
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_query_cached(question):
+    return _parse_query_uncached(question)
 
-    question_lower = question.lower()
+def _parse_query_uncached(question):
+    question_lower = _lower_aligned(question)
 
-    dish_price_match = re.search(r"(?:price|prices|cost|how much is|how much are)\s+(?:of|for)?\s+(.+?)(?:\s+across|\s+at all|\s+in all|\?|$)", question, re.IGNORECASE)
+    dish_price_match = _DISH_PRICE_RE.search(question_lower) if _mentions(question_lower, _DISH_PRICE_KEYS) else None
     if dish_price_match:
-        dish_name = dish_price_match.group(1).strip().rstrip('.?!')
-        if 2 < len(dish_name) < 50:
-            spec['dish_price_query'] = dish_name
-            logging.info(f"Detected dish price query for: '{dish_name}'")
-            return spec
+        if dish_name := _clean_name(_original(question, dish_price_match, 1)):
+            logger.info("Detected dish price query for: '%s'", dish_name)
+            return QuerySpec(dish_price_query=dish_name)
 
-    spice_match = re.search(r"compare spice.*? dish (.+?) between (.+?) and (.+)", question, re.IGNORECASE)
+    spice_match = _SPICE_CMP_RE.search(question_lower) if _mentions(question_lower, _SPICE_CMP_KEYS) else None
     if spice_match:
-        spec['spice_cmp'] = {
-            'dish': spice_match.group(1).strip(),
-            'restaurants': [spice_match.group(2).strip(), spice_match.group(3).strip()]
-        }
-        logging.info(f"Extracted spice comparison: {spec['spice_cmp']}")
-        return spec
+        spice_cmp = SpiceComparison(
+            dish=_original(question, spice_match, 1).strip(),
+            restaurants=(_original(question, spice_match, 2).strip(), _original(question, spice_match, 3).strip())
+        )
+        logger.info("Extracted spice comparison: %s", spice_cmp)
+        return QuerySpec(spice_cmp=spice_cmp)
 
-    compare_match = re.search(r"(?:compare|difference)\s+(?:(?:rating|price range)\s+)?(?:between|for)\s+(.+?)\s+and\s+(.+)", question, re.IGNORECASE) \
-                  or re.search(r"which is (better|higher rated|cheaper|more expensive)\s*,?\s*(.+?)\s+or\s+(.+)", question, re.IGNORECASE) \
-                  or re.search(r"what'?s the (rating|price)\s*(?:difference|range)?\s*(?:between|for)\s+(.+?)\s+and\s+(.+)", question, re.IGNORECASE)
+    compare_match = _search_any(_COMPARE_RES, question_lower) if _mentions(question_lower, _COMPARE_KEYS) else None
 
     if compare_match:
-        groups = compare_match.groups()
+        groups = tuple(_original(question, compare_match, i) for i in range(1, compare_match.re.groups + 1))
         feature = None
         qualifier = ""
-        matched_text = compare_match.group(0).lower()
-        if 'rating' in matched_text or 'rated' in matched_text or 'better' in matched_text:
+        # Whole words only, so restaurant names like 'Decorated Cafe' don't read as 'rated'
+        tokens = set(_WORD_RE.findall(compare_match.group(0)))
+        if not tokens.isdisjoint(_RATING_WORDS):
             feature = 'rating'
-            if 'better' in matched_text or 'higher' in matched_text: qualifier = 'higher'
-        elif 'price' in matched_text or 'cheaper' in matched_text or 'expensive' in matched_text:
+            if not tokens.isdisjoint(_HIGHER_WORDS): qualifier = 'higher'
+        elif not tokens.isdisjoint(_PRICE_WORDS):
             feature = 'price_range'
-            if 'cheaper' in matched_text: qualifier = 'cheaper'
-            if 'expensive' in matched_text: qualifier = 'more_expensive'
+            if 'cheaper' in tokens: qualifier = 'cheaper'
+            if 'expensive' in tokens: qualifier = 'more_expensive'
 
         r1, r2 = None, None
         if len(groups) == 3:
@@ -63,50 +179,38 @@ def parse_query(question):
               r2 = groups[1].strip().rstrip('?.!')
 
         if r1 and r2 and feature:
-            spec['feature_compare'] = {'restaurants': [r1, r2], 'feature': feature, 'qualifier': qualifier}
-            logging.info(f"Detected feature comparison query: {spec['feature_compare']}")
-            return spec
+            feature_compare = FeatureComparison(restaurants=(r1, r2), feature=feature, qualifier=qualifier)
+            logger.info("Detected feature comparison query: %s", feature_compare)
+            return QuerySpec(feature_compare=feature_compare)
 
-    price_range_match = re.search(r"(?:is|are)\s+(.+?)\s+(expensive|cheap|pricey|mid-range|affordable)\b", question, re.IGNORECASE) \
-                      or re.search(r"what'?s the price range for\s+(.+)", question, re.IGNORECASE) \
-                      or re.search(r"how expensive is\s+(.+)", question, re.IGNORECASE)
+    # Every intent above returns as soon as it matches, so reaching here means none did
+    price_range_match = _search_any(_PRICE_RANGE_RES, question_lower) if _mentions(question_lower, _PRICE_RANGE_KEYS) else None
     if price_range_match:
-        if not spec['feature_compare']:
-            resto_name = price_range_match.group(1).strip().rstrip('?.!')
-            if ' and ' not in resto_name.lower():
-                if 2 < len(resto_name) < 50:
-                    spec['price_range_query'] = resto_name
-                    logging.info(f"Detected price range query for: '{resto_name}'")
-                    return spec
-
-    is_other_spec_set = any(spec[key] for key in ['dish_price_query', 'spice_cmp', 'feature_compare', 'price_range_query'])
-    if not is_other_spec_set:
-        resto_patterns = [
-            r"(?:menu|dishes)\s+(?:at|in|from)\s+(.+)",
-            r"(.+?)\s+(?:menu|dishes)"
-        ]
-        for pattern in resto_patterns:
-            resto_match = re.search(pattern, question, re.IGNORECASE)
+        resto_name = _clean_name(_original(question, price_range_match, 1))
+        if resto_name and ' and ' not in resto_name.lower():
+            logger.info("Detected price range query for: '%s'", resto_name)
+            return QuerySpec(price_range_query=resto_name)
+
+    if _mentions(question_lower, _RESTO_KEYS):
+        for pattern in _RESTO_RES:
+            resto_match = pattern.search(question_lower)
             if resto_match:
-                potential_name = resto_match.group(1).strip().rstrip('.?!')
-                if 2 < len(potential_name) < 50:
-                    spec['restaurant'] = potential_name
-                    logging.info(f"Extracted restaurant name for menu listing: '{spec['restaurant']}'")
-                    spec['price_lt'] = None
-                    spec['dietary'] = []
-                    return spec
-
-    price_match = re.search(r"(?:under|less than|below)\s*₹?(\d+)", question, re.IGNORECASE)
-    if price_match:
-        spec['price_lt'] = int(price_match.group(1))
-        logging.info(f"Extracted price filter: < {spec['price_lt']}")
+                if potential_name := _clean_name(_original(question, resto_match, 1)):
+                    logger.info("Extracted restaurant name for menu listing: '%s'", potential_name)
+                    return QuerySpec(restaurant=potential_name)
 
-    if re.search(r'\bvegan\b', question_lower): spec['dietary'].append('vegan')
-    if re.search(r'gluten[\s-]?free\b', question_lower): spec['dietary'].append('gluten_free')
-    if re.search(r'\bvegetarian\b', question_lower): spec['dietary'].append('vegetarian')
+    price_lt = None
+    price_match = _PRICE_LT_RE.search(question_lower) if _mentions(question_lower, _PRICE_LT_KEYS) else None
+    if price_match:
+        price_lt = int(price_match.group(1))
+        logger.info("Extracted price filter: < %s", price_lt)
 
-    if spec['dietary']: logging.info(f"Extracted dietary filters: {spec['dietary']}")
+    dietary = ()
+    if _mentions(question_lower, _DIETARY_KEYS):
+        dietary = tuple(tag for tag in DIETARY_TAGS if _DIETARY_CHECKS[tag](question_lower))
 
+    if dietary: logger.info("Extracted dietary filters: %s", dietary)
 
-    logging.info(f"Final parsed query spec (no specific intent matched or only filters): {spec}")
-    return spec
\ No newline at end of file
+    spec = QuerySpec(price_lt=price_lt, dietary=dietary)
+    logger.info("Final parsed query spec (no specific intent matched or only filters): %s", spec)
+    return spec
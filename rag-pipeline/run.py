@@ -1,26 +1,33 @@
-import os
+import logging
 from fetch_restaurant import load_restaurants
 from chunking import build_dish_chunks
-from index_faiss import create_faiss_index
-from chatbot import answer
+from index_faiss import create_faiss_index, INDEX_CACHE_DIR
+from chatbot import answer_stream
+
+EXIT_COMMANDS = frozenset(('exit', 'quit'))
 
 def main():
     #Load from JSON
-    base = os.path.dirname(__file__)
     restaurants = load_restaurants()
 
     #Build chunks & index
     chunks = build_dish_chunks(restaurants)
-    embed_model, index = create_faiss_index(chunks)
+    embed_model, index = create_faiss_index(chunks, cache_dir=INDEX_CACHE_DIR)
 
     #Chat loop
     print("Zomato RAG Chatbot ready! Type 'exit' to quit.")
     while True:
-        q = input("\nYou: ")
-        if q.lower() in ('exit', 'quit'):
+        q = input("\nYou: ").strip()
+        if q.lower() in EXIT_COMMANDS:
             break
-        resp = answer(q, embed_model, index, chunks)
-        print("Bot:", resp)
+        if not q:
+            continue
+        print("Bot: ", end="", flush=True)
+        for piece in answer_stream(q, embed_model, index, chunks, restaurants):
+            print(piece, end="", flush=True) # Gemini answers print as they are generated
+        print()
 
 if __name__ == "__main__":
+    # Logging is configured by the entry point only; imported modules just use their logger
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     main()
@@ -2,6 +2,14 @@ import json
 import os
 import sys
 import logging
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson # Optional: serializes the output several times faster than json
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
 
 # Adjust path to import from sibling directory 'scraper' and 'src'
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -16,42 +24,58 @@ try:
     # If it's truly in src/main.py, that might indicate main.py has multiple responsibilities.
     # For now, we keep the original assumption based on the input code.
 except ImportError as e:
-    logging.exception("Failed to import necessary modules. Check project structure and sys.path.")
+    logger.exception("Failed to import necessary modules. Check project structure and sys.path.")
     sys.exit(f"Import Error: {e}. Please ensure the script is run correctly relative to the project root.")
 
 
-# Setup basic logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Sites are scraped concurrently; each request spends nearly all its time waiting on the network
+MAX_SCRAPE_WORKERS = int(os.environ.get('SCRAPE_WORKERS', 16))
+
+
+def _scrape_one(site):
+    """Scrape a single site entry from the config. Returns (site, data or None)."""
+    url = site.get('url')
+    name = site.get('name', url)  # Use name if available, otherwise URL
+    logger.info("Attempting to scrape: %s (%s)", name, url)
+    try:
+        # Instantiate scraper from the corrected import
+        scraper = RestaurantScraper(url)
+        return site, scraper.scrape() # scrape() method handles its own internal errors/logging
+    except Exception as error:
+        # Catch exceptions during scraper instantiation or unexpected issues in scrape() call
+        logger.error("Unhandled error scraping %s (%s): %s", name, url, error, exc_info=True)
+        # Optionally use the imported error handler
+        # handle_errors(error, context=f"scraping orchestration for {url}")
+        return site, None
 
 def extract_and_save_raw_data():
     """Extract raw data from restaurant URLs and save to raw_extracted_data.json."""
     sites_config = load_config() # Assumes load_config finds 'config/sites.json' relative to project root or CWD
 
     if not sites_config or 'sites' not in sites_config or not sites_config['sites']:
-        logging.error('Error: No sites found in config/sites.json or the file is invalid.')
+        logger.error('Error: No sites found in config/sites.json or the file is invalid.')
 
     all_extracted_data = []  # List to store all extracted data
     processed_count = 0
     error_count = 0
 
-    logging.info(f"Starting extraction for {len(sites_config['sites'])} sites listed in config.")
+    logger.info("Starting extraction for %s sites listed in config.", len(sites_config['sites']))
 
+    sites = []
     for site in sites_config['sites']:
-        url = site.get('url')
-        name = site.get('name', url)  # Use name if available, otherwise URL
-
-        if not url:
-            logging.warning(f"Skipping site entry without a URL: {site}")
+        if not site.get('url'):
+            logger.warning("Skipping site entry without a URL: %s", site)
             continue
+        sites.append(site)
 
-        logging.info(f"Attempting to scrape: {name} ({url})")
-        try:
-            # Instantiate scraper from the corrected import
-            scraper = RestaurantScraper(url)
-            restaurant_data = scraper.scrape() # scrape() method handles its own internal errors/logging
+    # map() yields results in config order, so the output file is stable across runs
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_SCRAPE_WORKERS, len(sites)))) as executor:
+        for site, restaurant_data in executor.map(_scrape_one, sites):
+            url = site['url']
+            name = site.get('name', url)
 
             if restaurant_data:
-                logging.info(f"Successfully extracted data for {name}")
+                logger.info("Successfully extracted data for %s", name)
                 # Optional: Add site metadata from config if not already present from scraper
                 restaurant_data['config_name'] = name
                 restaurant_data['config_url'] = url
@@ -59,16 +83,10 @@ def extract_and_save_raw_data():
                 processed_count += 1
             else:
                 # scrape() returns None on failure, which is already logged within scrape() or fetch_data()
-                logging.warning(f"No data extracted for {name} ({url}). Check previous logs for details.")
+                logger.warning("No data extracted for %s (%s). Check previous logs for details.", name, url)
                 error_count += 1
-        except Exception as error:
-            # Catch exceptions during scraper instantiation or unexpected issues in scrape() call
-            logging.error(f"Unhandled error scraping {name} ({url}): {error}", exc_info=True)
-            # Optionally use the imported error handler
-            # handle_errors(error, context=f"scraping orchestration for {url}")
-            error_count += 1
 
-    logging.info(f"Extraction finished. Successfully processed: {processed_count}, Failed/No Data: {error_count}")
+    logger.info("Extraction finished. Successfully processed: %s, Failed/No Data: %s", processed_count, error_count)
 
     # Save all extracted data to raw_extracted_data.json (replacing existing data)
     # Ensure output directory exists relative to this script's location
@@ -77,14 +95,20 @@ def extract_and_save_raw_data():
     output_path = os.path.join(output_dir, 'raw_extracted_data.json')
 
     try:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(all_extracted_data, f, indent=4, ensure_ascii=False)
-        logging.info(f"Saved extracted data for {processed_count} sites to {output_path}")
+        if orjson is not None:
+            with open(output_path, 'wb') as f:
+                f.write(orjson.dumps(all_extracted_data, option=orjson.OPT_INDENT_2))
+        else:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(all_extracted_data, f, indent=2, ensure_ascii=False)
+        logger.info("Saved extracted data for %s sites to %s", processed_count, output_path)
     except IOError as e:
-        logging.error(f"Failed to write output file {output_path}: {e}")
+        logger.error("Failed to write output file %s: %s", output_path, e)
     except TypeError as e:
-         logging.error(f"Failed to serialize data to JSON: {e}")
+         logger.error("Failed to serialize data to JSON: %s", e)
 
 
 if __name__ == "__main__":
+    # Logging is configured by the entry point only; imported modules just use their logger
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     extract_and_save_raw_data()
\ No newline at end of file
@@ -1,13 +1,20 @@
 import json
 import os
+import re
 import requests
+import urllib3.exceptions
+from urllib.parse import urlsplit
 from xml.etree import ElementTree
 from collections import defaultdict
 import itertools
 import logging
 
-# Setup basic logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+try:
+    import orjson # Optional: serializes the output several times faster than json
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
 
 # Constants
 DEFAULT_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 Brave/1.61.109.0" # Represents Brave Browser
@@ -16,6 +23,9 @@ DEFAULT_CONTACT_INFO = "+91 9876543210"
 MAX_LOCATIONS_PER_RESTAURANT_NAME = 5
 MAX_UNIQUE_RESTAURANT_CHAINS = 10
 
+# Last two segments of a URL path, e.g. '/restaurant-name/location-name/'
+_URL_TAIL_RE = re.compile(r'/([^/]+)/([^/]+)/*$')
+
 def fetch_sitemap_links(target_sitemap_url: str) -> list[str]:
     """
     Fetches and parses an XML sitemap to extract all contained URLs.
@@ -29,27 +39,64 @@ def fetch_sitemap_links(target_sitemap_url: str) -> list[str]:
     request_headers = {"User-Agent": DEFAULT_USER_AGENT}
     extracted_links = []
     try:
-        http_response = requests.get(target_sitemap_url, headers=request_headers, timeout=30)
-        http_response.raise_for_status() # Raises HTTPError for bad responses (4xx or 5xx)
-
-        xml_root = ElementTree.fromstring(http_response.content)
-        # Find all 'url' elements regardless of namespace, then find the 'loc' element within each
-        # The '{*}' syntax handles namespaces gracefully.
-        for url_element in xml_root.findall('{*}url'):
-            loc_element = url_element.find('{*}loc')
-            if loc_element is not None and loc_element.text:
-                extracted_links.append(loc_element.text.strip())
-
-        logging.info(f"Found {len(extracted_links)} URLs in sitemap: {target_sitemap_url}")
-    except requests.exceptions.RequestException as e:
-        logging.error(f"HTTP error fetching sitemap {target_sitemap_url}: {e}")
+        # Stream the body straight into the parser instead of buffering the whole sitemap
+        with requests.get(target_sitemap_url, headers=request_headers, timeout=30, stream=True) as http_response:
+            http_response.raise_for_status() # Raises HTTPError for bad responses (4xx or 5xx)
+            http_response.raw.decode_content = True # Undo gzip/deflate transfer encoding
+
+            # Each top-level 'url' element is complete at its end event; read its 'loc' child,
+            # then detach it from the root so memory stays flat however large the sitemap is.
+            # The '{*}' syntax handles namespaces gracefully.
+            root = None
+            depth = 0
+            for event, element in ElementTree.iterparse(http_response.raw, events=('start', 'end')):
+                if event == 'start':
+                    if root is None:
+                        root = element
+                    depth += 1
+                    continue
+                depth -= 1
+                if depth != 1:
+                    continue # Only direct children of the root, like findall('{*}url')
+                if element.tag.rpartition('}')[2] == 'url':
+                    loc_element = element.find('{*}loc')
+                    if loc_element is not None and loc_element.text:
+                        extracted_links.append(loc_element.text.strip())
+                root.clear() # Drops the finished child; nothing else is attached yet
+
+        logger.info("Found %s URLs in sitemap: %s", len(extracted_links), target_sitemap_url)
+    except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError) as e:
+        logger.error("HTTP error fetching sitemap %s: %s", target_sitemap_url, e)
+        extracted_links = []
     except ElementTree.ParseError as e:
-        logging.error(f"XML parsing error for {target_sitemap_url}: {e}")
+        logger.error("XML parsing error for %s: %s", target_sitemap_url, e)
+        extracted_links = []
     except Exception as e:
-        logging.error(f"An unexpected error occurred during sitemap parsing: {e}")
+        logger.error("An unexpected error occurred during sitemap parsing: %s", e)
+        extracted_links = []
 
     return extracted_links
 
+def _url_tail(page_url: str) -> tuple[str, str] | None:
+    """Returns the last two path segments of a URL (e.g. https://domain/name/location ->
+    ('name', 'location')), or None if the path is too short."""
+    match = _URL_TAIL_RE.search(urlsplit(page_url).path)
+    return match.groups() if match else None
+
+def _title_from_slug(slug: str) -> str:
+    """'pizza-hut' -> 'Pizza Hut'."""
+    return slug.replace('-', ' ').title()
+
+def _location_from_segments(page_url: str, restaurant_name: str, location_slug: str) -> dict:
+    """Builds the basic location record for a URL whose tail has already been split."""
+    return {
+        "name": restaurant_name,
+        "url": page_url,
+        "location": _title_from_slug(location_slug),
+        "notes": "Basic info extracted from URL. Needs detailed scraping.",
+        # Default time/contact will be added later if needed
+    }
+
 def parse_info_from_url(page_url: str) -> dict | None:
     """
     Attempts to extract basic restaurant information based on URL path segments.
@@ -63,34 +110,21 @@ def parse_info_from_url(page_url: str) -> dict | None:
         or None if parsing fails.
     """
     try:
-        # Remove potential trailing slash and split
-        url_segments = page_url.strip('/').split('/')
-        # Check if we have enough segments (e.g., https://domain/path/name/location)
-        if len(url_segments) >= 5:
-            # Assume name is the 4th segment (index 3) and location is 5th (index 4)
-            restaurant_name = url_segments[-2].replace('-', ' ').title()
-            location_name = url_segments[-1].replace('-', ' ').title()
-            return {
-                "name": restaurant_name,
-                "url": page_url,
-                "location": location_name,
-                "notes": "Basic info extracted from URL. Needs detailed scraping.",
-                # Default time/contact will be added later if needed
-            }
+        url_segments = _url_tail(page_url)
+        if url_segments:
+            return _location_from_segments(page_url, _title_from_slug(url_segments[0]), url_segments[1])
         else:
-            logging.warning(f"URL structure insufficient for parsing: {page_url}")
+            logger.warning("URL structure insufficient for parsing: %s", page_url)
             return None
-    except IndexError:
-        logging.warning(f"Index error while parsing URL segments for: {page_url}")
-        return None
     except Exception as e:
-        logging.error(f"Unexpected error parsing URL {page_url}: {e}")
+        logger.error("Unexpected error parsing URL %s: %s", page_url, e)
         return None
 
 
 def aggregate_locations_by_restaurant(link_list: list[str]) -> dict[str, list[dict]]:
     """
-    Groups parsed restaurant location data by restaurant name, limiting locations per name.
+    Groups parsed restaurant location data by restaurant name, limiting locations per name
+    and keeping only the first MAX_UNIQUE_RESTAURANT_CHAINS names seen.
 
     Args:
         link_list: A list of URLs to process.
@@ -100,17 +134,30 @@ def aggregate_locations_by_restaurant(link_list: list[str]) -> dict[str, list[di
         location data dictionaries (up to MAX_LOCATIONS_PER_RESTAURANT_NAME).
     """
     restaurants_by_name = defaultdict(list)
+    full_chains = set() # Names that already hold MAX_LOCATIONS_PER_RESTAURANT_NAME locations
     parsed_location_count = 0
     for link in link_list:
-        location_info = parse_info_from_url(link)
-        if location_info:
-            restaurant_name = location_info["name"]
-            # Only add if we haven't reached the max limit for this restaurant
-            if len(restaurants_by_name[restaurant_name]) < MAX_LOCATIONS_PER_RESTAURANT_NAME:
-                restaurants_by_name[restaurant_name].append(location_info)
-                parsed_location_count += 1
-
-    logging.info(f"Aggregated {parsed_location_count} locations under {len(restaurants_by_name)} unique restaurant names.")
+        url_segments = _url_tail(link)
+        if not url_segments:
+            logger.warning("URL structure insufficient for parsing: %s", link)
+            continue
+        # Check the chain name first so URLs that would be dropped skip building a record
+        restaurant_name = _title_from_slug(url_segments[0])
+        if restaurant_name in full_chains or (
+            len(restaurants_by_name) >= MAX_UNIQUE_RESTAURANT_CHAINS and restaurant_name not in restaurants_by_name
+        ):
+            continue
+
+        locations = restaurants_by_name[restaurant_name]
+        locations.append(_location_from_segments(link, restaurant_name, url_segments[1]))
+        parsed_location_count += 1
+        if len(locations) >= MAX_LOCATIONS_PER_RESTAURANT_NAME:
+            full_chains.add(restaurant_name)
+            # Every selected chain is full; nothing further can be added
+            if len(full_chains) >= MAX_UNIQUE_RESTAURANT_CHAINS:
+                break
+
+    logger.info("Aggregated %s locations under %s unique restaurant names.", parsed_location_count, len(restaurants_by_name))
     return dict(restaurants_by_name) # Convert back to regular dict if defaultdict behavior is not needed downstream
 
 
@@ -136,14 +183,19 @@ def persist_restaurant_data(restaurant_entries: list[dict], output_filepath: str
         if output_dir: # Avoid error if path is just a filename in the current dir
              os.makedirs(output_dir, exist_ok=True)
 
-        with open(output_filepath, 'w', encoding='utf-8') as outfile:
-            # Use ensure_ascii=False for broader character support (e.g., non-English names)
-            json.dump(output_structure, outfile, indent=4, ensure_ascii=False)
-        logging.info(f"Successfully saved {len(output_structure['sites'])} entries to {output_filepath}")
+        if orjson is not None:
+            # orjson always writes UTF-8 without escaping non-ASCII characters
+            with open(output_filepath, 'wb') as outfile:
+                outfile.write(orjson.dumps(output_structure, option=orjson.OPT_INDENT_2))
+        else:
+            with open(output_filepath, 'w', encoding='utf-8') as outfile:
+                # Use ensure_ascii=False for broader character support (e.g., non-English names)
+                json.dump(output_structure, outfile, indent=2, ensure_ascii=False)
+        logger.info("Successfully saved %s entries to %s", len(output_structure['sites']), output_filepath)
     except IOError as e:
-        logging.error(f"Error writing to JSON file {output_filepath}: {e}")
+        logger.error("Error writing to JSON file %s: %s", output_filepath, e)
     except Exception as e:
-        logging.error(f"An unexpected error occurred during JSON persistence: {e}")
+        logger.error("An unexpected error occurred during JSON persistence: %s", e)
 
 
 def process_sitemap_and_generate_config():
@@ -159,13 +211,13 @@ def process_sitemap_and_generate_config():
     # 1. Fetch URLs from the sitemap
     sitemap_links = fetch_sitemap_links(source_sitemap_url)
     if not sitemap_links:
-        logging.warning("No links retrieved from sitemap. Halting process.")
+        logger.warning("No links retrieved from sitemap. Halting process.")
         return
 
     # 2. Aggregate locations by restaurant name from parsed URLs
     aggregated_restaurants = aggregate_locations_by_restaurant(sitemap_links)
     if not aggregated_restaurants:
-        logging.warning("No restaurant data could be aggregated. Halting process.")
+        logger.warning("No restaurant data could be aggregated. Halting process.")
         return
 
     # 3. Select a limited number of unique restaurant chains
@@ -176,14 +228,16 @@ def process_sitemap_and_generate_config():
         final_restaurant_selection.extend(location_list)
 
     if not final_restaurant_selection:
-        logging.warning("No restaurants remained after selection. Halting process.")
+        logger.warning("No restaurants remained after selection. Halting process.")
         return
 
     # 4. Persist the selected data to the JSON configuration file
     persist_restaurant_data(final_restaurant_selection, output_json_path)
 
-    logging.info(f"Sitemap processing complete. Output generated at {output_json_path}.")
+    logger.info("Sitemap processing complete. Output generated at %s.", output_json_path)
 
 
 if __name__ == "__main__":
+    # Logging is configured by the entry point only; imported modules just use their logger
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     process_sitemap_and_generate_config()
\ No newline at end of file
@@ -1,12 +1,33 @@
+import threading
 import requests
 import logging
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-# Configure logging (basic example, might be configured elsewhere in a larger app)
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 DEFAULT_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36"
 
+# Connection pool and retry policy mounted on every Session; transient gateway
+# errors are retried with backoff before fetch_data gives up on a URL
+POOL_SIZE = 32
+RETRY_POLICY = Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+
+# One Session per thread: keep-alive connections are reused across fetches,
+# and scraper worker threads never share a Session (which is not thread-safe)
+_thread_local = threading.local()
+
+def get_session() -> requests.Session:
+    """Returns the calling thread's requests.Session, creating it on first use."""
+    session = getattr(_thread_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=RETRY_POLICY)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _thread_local.session = session
+    return session
+
 def fetch_data(url: str, user_agent: str = DEFAULT_USER_AGENT) -> str | None:
     """
     Fetches HTML content from a given URL with appropriate headers and error handling.
@@ -20,21 +41,21 @@ def fetch_data(url: str, user_agent: str = DEFAULT_USER_AGENT) -> str | None:
     """
     try:
         headers = {'User-Agent': user_agent}
-        response = requests.get(url, headers=headers, timeout=10)  # Added timeout
+        response = get_session().get(url, headers=headers, timeout=10)  # Added timeout
         response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
-        logger.info(f"Successfully fetched data from {url}")
+        logger.info("Successfully fetched data from %s", url)
         return response.text
     except requests.exceptions.Timeout:
-        logger.error(f"Timeout error while fetching {url}")
+        logger.error("Timeout error while fetching %s", url)
         return None
     except requests.exceptions.HTTPError as http_err:
-        logger.error(f"HTTP error occurred while fetching {url}: {http_err} - Status Code: {http_err.response.status_code}")
+        logger.error("HTTP error occurred while fetching %s: %s - Status Code: %s", url, http_err, http_err.response.status_code)
         return None
     except requests.exceptions.RequestException as req_err:
-        logger.error(f"Error fetching {url}: {req_err}")
+        logger.error("Error fetching %s: %s", url, req_err)
         return None
     except Exception as e:
-        logger.exception(f"An unexpected error occurred while fetching {url}: {e}") # Catch other potential errors
+        logger.exception("An unexpected error occurred while fetching %s: %s", url, e) # Catch other potential errors
         return None
 
 def handle_general_error(error: Exception, context: str = "General operation"):
@@ -45,7 +66,7 @@ def handle_general_error(error: Exception, context: str = "General operation"):
         error: The exception object that occurred.
         context: A string describing the context where the error happened.
     """
-    logger.error(f"An error occurred during {context}: {error}", exc_info=True)
+    logger.error("An error occurred during %s: %s", context, error, exc_info=True)
     # In a real application, you might add more sophisticated handling:
     # - Send notifications (e.g., email, Slack)
     # - Implement specific retry logic based on error type